@@ -1,133 +1,238 @@
 import streamlit as st
 import os
+import concurrent.futures
 import re
 import subprocess
 import shutil
 import sys
+import threading
 import time
+from collections import deque
 from typing import Tuple, List
 
 # --- Core Business Logic (Adapted from Insta.py) ---
 
+_SHORTCODE_RE = re.compile(r'\/(?:p|reel)\/([a-zA-Z0-9_-]+)')
+
+# Hide the console window for child processes on Windows
+_STARTUPINFO = (
+    subprocess.STARTUPINFO(dwFlags=subprocess.STARTF_USESHOWWINDOW)
+    if sys.platform == "win32" else None
+)
+
+# instaloader invocation; the post target is appended per download
+_DOWNLOAD_COMMAND = (
+    'instaloader',
+    '--dirname-pattern={target}',
+    '--filename-pattern={profile}_{date_utc:%Y-%m-%d}_{shortcode}',
+    '--no-metadata-json',
+    '--no-captions',
+    '--no-profile-pic',
+    '--no-compress-json',
+    '--post-filter=not is_sponsored',
+    '--',
+)
+
+# Progress reporting for download_content
+_POLL_INTERVAL = 0.2
+_PROGRESS_RE = re.compile(r'\[\s*(\d+)/\s*(\d+)\]')
+_EXPECTED_DOWNLOAD_SECONDS = 10.0
+_STDERR_TAIL_LINES = 200
+
+# Known instaloader failures, keyed by the named group that matched
+_ERROR_RE = re.compile(
+    r'(?P<private>Private|Login required)'
+    r'|(?P<not_found>404|(?i:not found))'
+    r'|(?P<rate_limit>Rate limit)'
+)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _instaloader_version() -> str:
+    """Return the instaloader version; failures raise and so are never cached."""
+    result = subprocess.run(
+        ['instaloader', '--version'],
+        capture_output=True, text=True, check=True,
+        startupinfo=_STARTUPINFO
+    )
+    return result.stdout.strip()
+
 def check_instaloader() -> bool:
-    """Check if instaloader is installed."""
+    """Check if instaloader is installed (only a positive probe is cached)."""
+    if shutil.which('instaloader') is None:
+        return False
     try:
-        subprocess.run(
-            ['instaloader', '--version'],
-            capture_output=True, text=True, check=True,
-            startupinfo=subprocess.STARTUPINFO(dwFlags=subprocess.STARTF_USESHOWWINDOW) if sys.platform == "win32" else None
-        )
+        _instaloader_version()
         return True
     except (subprocess.SubprocessError, FileNotFoundError):
         return False
 
+@st.cache_resource
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """
+    Return the process-wide pool that runs downloads off the script thread.
+    
+    Cached as a resource because Streamlit re-executes this module on every rerun.
+    """
+    return concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
 def extract_shortcode(url: str) -> str:
     """Extract the shortcode from various Instagram post URL formats."""
-    patterns = [
-        r'instagram\.com\/p\/([a-zA-Z0-9_-]+)',
-        r'instagram\.com\/reel\/([a-zA-Z0-9_-]+)',
-        r'\/p\/([a-zA-Z0-9_-]+)',
-        r'\/reel\/([a-zA-Z0-9_-]+)',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    # Cheap substring check rejects arbitrary text before running the regex
+    if '/p/' not in url and '/reel/' not in url:
+        raise ValueError("Invalid Instagram post URL format.")
+    match = _SHORTCODE_RE.search(url)
+    if match:
+        return match.group(1)
     raise ValueError("Invalid Instagram post URL format.")
 
-def download_content(shortcode: str) -> Tuple[bool, str]:
+def download_content(shortcode: str, job: dict) -> Tuple[bool, str]:
     """
     Download Instagram content using the instaloader command-line tool.
     
+    Runs on a worker thread, so it must not call Streamlit; progress, the
+    running process and cancellation are exchanged through the `job` dict.
     Returns a tuple of (success, message_or_error).
     """
     try:
-        command = [
-            'instaloader',
-            '--dirname-pattern={target}',
-            '--filename-pattern={profile}_{date_utc:%Y-%m-%d}_{shortcode}',
-            '--no-metadata-json',
-            '--no-captions',
-            '--no-profile-pic',
-            '--no-compress-json',
-            '--post-filter=not is_sponsored',
-            '--',
-            f'-{shortcode}'
-        ]
-
-        status_placeholder = st.empty()
-        progress_bar = st.progress(0)
-        
+        command = [*_DOWNLOAD_COMMAND, f'-{shortcode}']
+
         process = subprocess.Popen(
             command,
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
-            startupinfo=subprocess.STARTUPINFO(dwFlags=subprocess.STARTF_USESHOWWINDOW) if sys.platform == "win32" else None
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1,
+            startupinfo=_STARTUPINFO
         )
+        job['process'] = process
+        if job['cancelled']:
+            process.terminate()
+
+        # Keep only the tail of stderr for diagnostics, drained on a side thread
+        stderr_tail = deque(maxlen=_STDERR_TAIL_LINES)
+        stderr_reader = threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+        stderr_reader.start()
 
-        # Simulate progress while the process is running
-        for i in range(95):
-            if process.poll() is not None:
-                break
-            status_placeholder.info(f"🚀 Downloading content for shortcode: `{shortcode}`...")
-            progress_bar.progress(i + 1)
-            time.sleep(0.1)
+        # Record instaloader's "[ x/ y]" markers as a progress floor; the UI
+        # fills the gaps between them from elapsed time (see download_progress)
+        job['start'] = time.monotonic()
+        for line in process.stdout:
+            marker = _PROGRESS_RE.search(line)
+            if marker and int(marker.group(2)):
+                estimate = int(marker.group(1)) * 95 // int(marker.group(2))
+                job['progress'] = max(job['progress'], min(95, estimate))
 
-        stdout, stderr = process.communicate()
-        progress_bar.progress(100)
+        process.wait()
+        stderr_reader.join()
+        job['progress'] = 100
         
+        if job['cancelled']:
+            # Remove the partial download so the next cleanup doesn't collect it
+            shutil.rmtree(f'-{shortcode}', ignore_errors=True)
+            return False, "Download cancelled."
         if process.returncode == 0:
-            status_placeholder.success("✅ Download process completed.")
             return True, "Download successful!"
         else:
-            error_message = stderr.strip()
-            if "Private" in error_message or "Login required" in error_message:
+            error_message = ''.join(stderr_tail).strip()
+            # Classify in a single pass, then report the most specific cause
+            error_kinds = {match.lastgroup for match in _ERROR_RE.finditer(error_message)}
+            if 'private' in error_kinds:
                 return False, "This post is private or requires a login."
-            if "404" in error_message or "not found" in error_message.lower():
+            if 'not_found' in error_kinds:
                 return False, "This post could not be found (404 Error)."
-            if "Rate limit" in error_message:
+            if 'rate_limit' in error_kinds:
                 return False, "Instagram rate limit reached. Please try again later."
             return False, f"Download failed: {error_message if error_message else 'Unknown error'}"
 
     except Exception as e:
         return False, f"An unexpected error occurred: {str(e)}"
 
-def move_and_collect_files(target_folder: str) -> List[str]:
+def start_download(shortcode: str, output_folder: str) -> dict:
+    """
+    Submit a download to the background executor and return its job record.
+    """
+    job = {
+        'shortcode': shortcode,
+        'output_folder': output_folder,
+        'progress': 0,
+        'start': None,
+        'process': None,
+        'cancelled': False,
+    }
+    job['future'] = _get_executor().submit(download_content, shortcode, job)
+    return job
+
+def download_progress(job: dict) -> int:
+    """
+    Return the percentage to display for a job: instaloader's reported
+    progress, or an elapsed-time estimate capped at 95 if that is further along.
+    """
+    if job['start'] is None:
+        return job['progress']
+    elapsed = time.monotonic() - job['start']
+    estimate = min(95, int(elapsed / _EXPECTED_DOWNLOAD_SECONDS * 95))
+    return max(job['progress'], estimate)
+
+def cancel_download(job: dict) -> None:
+    """Stop a download: drop it if still queued, else terminate instaloader."""
+    job['cancelled'] = True
+    process = job['process']
+    if process is None:
+        job['future'].cancel()
+    elif process.poll() is None:
+        process.terminate()
+
+def move_and_collect_files(target_folder: str) -> List[Tuple[str, str, int]]:
     """
-    Move downloaded files to the specified folder and return their new paths.
+    Move downloaded files to the specified folder.
+    
+    Returns a list of (path, name, size_in_bytes) tuples for the moved files,
+    so callers can display them without touching the filesystem again.
     """
     if not os.path.exists(target_folder):
         os.makedirs(target_folder)
 
     current_dir = os.getcwd()
-    moved_files_paths = []
+    moved_files = []
+    # Track taken names in memory so conflicts don't re-stat the folder
+    existing_names = set(os.listdir(target_folder))
 
-    for item in os.listdir(current_dir):
-        item_path = os.path.join(current_dir, item)
-        if os.path.isdir(item_path) and item != target_folder and not item.startswith('.'):
+    with os.scandir(current_dir) as entries:
+        for entry in entries:
+            if (not entry.is_dir(follow_symlinks=False)
+                    or entry.name == target_folder or entry.name.startswith('.')):
+                continue
             try:
-                for file in os.listdir(item_path):
-                    source_path = os.path.join(item_path, file)
-                    destination_path = os.path.join(target_folder, file)
-                    
-                    # Handle potential file conflicts by renaming
-                    if os.path.exists(destination_path):
-                        base, ext = os.path.splitext(file)
-                        counter = 1
-                        while os.path.exists(destination_path):
-                            new_name = f"{base}_{counter}{ext}"
-                            destination_path = os.path.join(target_folder, new_name)
-                            counter += 1
-                            
-                    shutil.move(source_path, destination_path)
-                    moved_files_paths.append(destination_path)
-                shutil.rmtree(item_path)
+                with os.scandir(entry.path) as files:
+                    for file in files:
+                        new_name = file.name
+                        
+                        # Handle potential file conflicts by renaming
+                        if new_name in existing_names:
+                            base, ext = os.path.splitext(file.name)
+                            counter = 1
+                            while new_name in existing_names:
+                                new_name = f"{base}_{counter}{ext}"
+                                counter += 1
+                        existing_names.add(new_name)
+                        destination_path = os.path.join(target_folder, new_name)
+                                
+                        size = file.stat().st_size
+                        # Destination is known to be free, so a plain rename
+                        # suffices unless it crosses filesystems
+                        try:
+                            os.rename(file.path, destination_path)
+                        except OSError:
+                            shutil.move(file.path, destination_path)
+                        moved_files.append((destination_path, new_name, size))
+                shutil.rmtree(entry.path)
             except OSError as e:
-                st.warning(f"Could not process directory {item}: {e}")
+                st.warning(f"Could not process directory {entry.name}: {e}")
     
-    return moved_files_paths
+    return moved_files
 
 # --- Streamlit User Interface ---
 
+_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.webp'})
+_VIDEO_EXTENSIONS = frozenset({'.mp4', '.mov'})
+
 def main():
     # --- Page Configuration ---
     st.set_page_config(
@@ -217,15 +322,39 @@ def main():
     if submit_button:
         if not url:
             st.warning("⚠️ Please enter an Instagram URL.")
+        elif 'dl_job' in st.session_state:
+            st.warning("⏳ A download is already in progress.")
         else:
             try:
                 shortcode = extract_shortcode(url)
-                st.info(f"🔍 Detected shortcode: `{shortcode}`")
-                
-                # --- Download & Process ---
-                success, message = download_content(shortcode)
+                st.session_state['dl_job'] = start_download(shortcode, output_folder)
+            except ValueError as e:
+                st.error(f"❌ **Invalid URL:** {e}")
+                st.info("Please make sure you're using a valid Instagram post or reel URL.")
+            except Exception as e:
+                st.error(f"❌ **An unexpected error occurred:** {e}")
+
+    # --- Download Progress & Results ---
+    job = st.session_state.get('dl_job')
+    if job:
+        st.info(f"🔍 Detected shortcode: `{job['shortcode']}`")
+
+        if not job['future'].done():
+            st.info(f"🚀 Downloading content for shortcode: `{job['shortcode']}`...")
+            st.progress(download_progress(job))
+            if st.button("✖️ Cancel Download", disabled=job['cancelled']):
+                cancel_download(job)
+        else:
+            del st.session_state['dl_job']
+            output_folder = job['output_folder']
+            try:
+                if job['future'].cancelled():
+                    success, message = False, "Download cancelled."
+                else:
+                    success, message = job['future'].result()
                 
                 if success:
+                    st.success("✅ Download process completed.")
                     with st.spinner("📦 Moving files and cleaning up..."):
                         moved_files = move_and_collect_files(output_folder)
                     
@@ -236,16 +365,16 @@ def main():
                         st.markdown("---")
                         st.subheader("📸 Downloaded Media:")
                         
-                        for file_path in moved_files:
-                            file_name = os.path.basename(file_path)
-                            file_size = os.path.getsize(file_path) / (1024 * 1024)  # Convert to MB
+                        for file_path, file_name, file_bytes in moved_files:
+                            file_size = file_bytes / (1024 * 1024)  # Convert to MB
                             
                             with st.container():
                                 st.caption(f"**{file_name}** ({file_size:.2f} MB)")
                                 
-                                if file_path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+                                ext = os.path.splitext(file_name)[1].lower()
+                                if ext in _IMAGE_EXTENSIONS:
                                     st.image(file_path, use_column_width=True)
-                                elif file_path.lower().endswith(('.mp4', '.mov')):
+                                elif ext in _VIDEO_EXTENSIONS:
                                     st.video(file_path)
                                 else:
                                     st.info(f"File downloaded: {file_name}")
@@ -272,9 +401,6 @@ def main():
                         ```
                         """)
 
-            except ValueError as e:
-                st.error(f"❌ **Invalid URL:** {e}")
-                st.info("Please make sure you're using a valid Instagram post or reel URL.")
             except Exception as e:
                 st.error(f"❌ **An unexpected error occurred:** {e}")
     
@@ -286,5 +412,10 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
+    # Poll the running download without blocking this script run
+    if 'dl_job' in st.session_state:
+        time.sleep(_POLL_INTERVAL)
+        st.rerun()
+
 if __name__ == "__main__":
     main()